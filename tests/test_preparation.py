@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from viloca.local_haplotype_inference.use_quality_scores import preparation as uqs_preparation
+from viloca.local_haplotype_inference.learn_error_params import preparation as lep_preparation
+
+
+@pytest.mark.parametrize("preparation", [uqs_preparation, lep_preparation])
+def test_reads_list_to_array(preparation):
+    reads_list = [
+        preparation.Read("ACGT", "read-1"),
+        preparation.Read("AN-T", "read-2"),
+    ]
+    reads_list[1].weight = 3
+
+    reads_binary_array, reads_weights_array = preparation.reads_list_to_array(
+        reads_list, "ACGT-"
+    )
+
+    assert reads_binary_array.shape == (2, 4, 5)
+    assert reads_binary_array.dtype == np.float32
+    assert np.array_equal(reads_binary_array[1, 1], np.zeros(5))
+    assert np.array_equal(reads_weights_array, [1, 3])
+    for read in reads_list:
+        assert np.shares_memory(read.seq_binary, reads_binary_array)
+        assert np.array_equal(
+            read.seq_binary, preparation.seq2onehot(read.seq_string, "ACGT-")
+        )
+
+
+@pytest.mark.parametrize("preparation", [uqs_preparation, lep_preparation])
+def test_reads_list_to_array_unequal_lengths(preparation):
+    reads_list = [
+        preparation.Read("ACGT", "read-1"),
+        preparation.Read("ACG", "read-2"),
+    ]
+
+    with pytest.raises(ValueError, match=r"same length.*\[3, 4\]"):
+        preparation.reads_list_to_array(reads_list, "ACGT-")
+
+
+def test_unique_reads_list_use_quality_scores():
+    seqs = ["ACGT", "AAAA", "ACGT", "CCCC", "ACGT", "AAAA"]
+    reads_list = []
+    for i, seq in enumerate(seqs):
+        read = uqs_preparation.Read(seq, "read-%d" % i)
+        read.phred_quality_score = np.full(4, 10.0 * (i + 1))
+        reads_list.append(read)
+
+    unique_reads = uqs_preparation.unique_reads_list(reads_list)
+
+    assert [read.id for read in unique_reads] == ["read-0", "read-1", "read-3"]
+    assert [read.weight for read in unique_reads] == [3, 2, 1]
+    assert [read.identical_reads for read in unique_reads] == [
+        ["read-2", "read-4"],
+        ["read-5"],
+        [],
+    ]
+    # running average in read order: ((10 + 30) / 2 + 50) / 2
+    assert np.array_equal(unique_reads[0].phred_quality_score, np.full(4, 35.0))
+    assert np.array_equal(unique_reads[1].phred_quality_score, np.full(4, 40.0))
+    assert np.array_equal(unique_reads[2].phred_quality_score, np.full(4, 40.0))
+
+
+def test_unique_reads_list_learn_error_params():
+    seqs = ["ACGT", "AAAA", "ACGT", "ACGT", "AAAA"]
+    reads_list = [
+        lep_preparation.Read(seq, "read-%d" % i) for i, seq in enumerate(seqs)
+    ]
+
+    unique_reads = lep_preparation.unique_reads_list(reads_list)
+
+    assert [read.id for read in unique_reads] == ["read-0", "read-1"]
+    assert [read.weight for read in unique_reads] == [3, 2]
+    assert [read.identical_reads for read in unique_reads] == [
+        ["read-2", "read-3"],
+        ["read-4"],
+    ]
+
+
+@pytest.mark.parametrize("preparation", [uqs_preparation, lep_preparation])
+@pytest.mark.parametrize("n_reads, length", [(1, 4), (3000, 250)])
+def test_einsum_reads(preparation, n_reads, length):
+    rng = np.random.default_rng(0)
+    reads_array = rng.random((n_reads, length, 5)).astype(np.float32)
+    mean_haplo = rng.random((3, length, 5))
+    mean_cluster = rng.random((n_reads, 3))
+
+    for subscripts, params in [
+        ("NLB,KLB->NK", mean_haplo),
+        ("NLB,NK->KLB", mean_cluster),
+    ]:
+        result = preparation.einsum_reads(subscripts, reads_array, params)
+        expected = np.einsum(subscripts, reads_array.astype(np.float64), params)
+
+        assert result.dtype == np.float64
+        assert np.allclose(result, expected, rtol=1e-12, atol=0)
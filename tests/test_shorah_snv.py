@@ -1,5 +1,7 @@
+import io
+import numpy as np
 import pytest
-from viloca.shorah_snv import _compare_ref_to_read, SNP_id, SNV
+from viloca.shorah_snv import BH, _compare_ref_to_read, _parse_support_header, read_fasta, SNP_id, SNV
 
 
 @pytest.mark.parametrize("ref, seq, spec", [
@@ -40,3 +42,51 @@ def test_compare_ref_to_read(ref, seq, spec):
     assert snp == spec
 
     assert tot_snv == len(snp)
+
+
+@pytest.mark.parametrize("fasta, spec", [
+    (">ref\nACGT\n", [("ref", "ref", "ACGT")]),
+    (">ref some description\nAC\nGT\n>second\nAA\nCC\nGG\n", [
+        ("ref", "ref some description", "ACGT"),
+        ("second", "second", "AACCGG"),
+    ]),
+    (">first\nAC\n>last\nGT", [("first", "first", "AC"), ("last", "last", "GT")]),
+    (">hap_0|posterior=1 ave_reads=18\nAC-T\n", [
+        ("hap_0|posterior=1", "hap_0|posterior=1 ave_reads=18", "AC-T"),
+    ]),
+    (">\nACGT\n", [("", "", "ACGT")]),
+    ("", []),
+])
+def test_read_fasta(fasta, spec):
+    assert list(read_fasta(io.StringIO(fasta))) == spec
+
+
+@pytest.mark.parametrize("record_id, description, spec", [
+    ("hap_0|posterior=1", "hap_0|posterior=1 ave_reads=18", ("hap_0", 1.0, 18.0)),
+    ("hap_12|posterior=0.9876", "hap_12|posterior=0.9876 ave_reads=3.5", ("hap_12", 0.9876, 3.5)),
+    ("hap_3|posterior=1.2e-05", "hap_3|posterior=1.2e-05 ave_reads=0.5", ("hap_3", 1.2e-05, 0.5)),
+])
+def test_parse_support_header(record_id, description, spec):
+    assert _parse_support_header(record_id, description) == spec
+
+
+# expected q-values as returned by the previous loop implementation: a
+# correction clipped to 1 is the int 1, a correction of exactly 1 the float
+# 1.0; the type is visible in the csv output
+@pytest.mark.parametrize("p_vals, n, spec", [
+    ([0.0, 0.125, 0.25], 4, [0.0, 0.25, 1 / 3]),
+    ([0.5, 0.75], 4, [1, 1]),
+    ([0.3, 0.35], 4, [1, 1]),
+    ([0.25, 0.5], 4, [1.0, 1.0]),
+    ([0.3, 0.5], 4, [1, 1.0]),
+    ([0.25, 0.625, 0.625], 4, [1.0, 1, 1]),
+    ([0.125, 0.125], 2, [0.25, 0.25]),
+    ([0.5, 0.5], 2, [1.0, 1.0]),
+    ([0.75, 0.75], 2, [1, 1]),
+    ([0.0625, 0.0625, 0.125, 0.125], 4, [0.25, 0.25, 0.25, 0.25]),
+    ([0.125, 0.5, 0.5, 0.75], 4, [0.5, 1.0, 1.0, 1.0]),
+])
+def test_BH(p_vals, n, spec):
+    q_vals = BH(np.array(p_vals), n)
+
+    assert [(type(q), q) for q in q_vals] == [(type(q), q) for q in spec]
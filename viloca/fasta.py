@@ -0,0 +1,20 @@
+def read_fasta(handle):
+    """
+    Yields (id, description, sequence) for each record of a FASTA file.
+    As in Bio.SeqIO, the id is the first word of the header line ("" for an
+    empty header) and the description is the full header line without '>'.
+    """
+    record_id = None
+    seq_lines = []
+    for line in handle:
+        if line.startswith(">"):
+            if record_id is not None:
+                yield record_id, description, "".join(seq_lines)
+            description = line[1:].rstrip()
+            header = description.split(maxsplit=1)
+            record_id = header[0] if header else ""
+            seq_lines = []
+        elif record_id is not None:
+            seq_lines.append(line.strip())
+    if record_id is not None:
+        yield record_id, description, "".join(seq_lines)
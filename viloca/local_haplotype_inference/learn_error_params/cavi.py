@@ -1,5 +1,9 @@
+import copy
+import math
 import numpy as np
 import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
 from scipy.special import digamma
 from scipy.stats._multivariate import _lnB as lnB
 from scipy.special import betaln
@@ -10,18 +14,6 @@ from . import update_eqs
 from . import elbo_eqs
 from . import analyze_results
 
-"""
-Parallelizing with Pool following:
-https://www.machinelearningplus.com/python/parallel-processing-python/
-"""
-
-results = []
-
-
-def collect_result(result):
-    global results
-    results.append(result)
-
 
 def multistart_cavi(
     K,
@@ -37,32 +29,103 @@ def multistart_cavi(
     record_history
 ):
 
-    pool = mp.Pool(mp.cpu_count())
-    for start in range(n_starts):
-        pool.apply_async(
-            run_cavi,
-            args=(
-                K,
-                alpha0,
-                alphabet,
-                reference_binary,
-                reference_seq,
-                reads_list,
-                reads_seq_binary,
-                reads_weights,
-                start,
-                output_dir,
-                record_history
-            ),
-            callback=collect_result,
-        )
+    # the large arrays are placed in shared memory once instead of being
+    # pickled for every start
+    shms = []
+    shared_arrays = []
+    for array in [reference_binary, reads_seq_binary, reads_weights]:
+        shm, shared_array = array_to_shared_memory(array)
+        shms.append(shm)
+        shared_arrays.append(shared_array)
+    # the seq_binary of the reads are views into reads_seq_binary
+    reads_list = [copy.copy(read) for read in reads_list]
+    for read in reads_list:
+        read.seq_binary = None
+        read.seq_string = str(read.seq_string)
 
-    pool.close()
-    pool.join()
+    try:
+        n_workers = min(mp.cpu_count(), n_starts)
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [
+                executor.submit(
+                    run_cavi_from_shared_memory,
+                    K,
+                    alpha0,
+                    alphabet,
+                    shared_arrays,
+                    reference_seq,
+                    reads_list,
+                    start,
+                    output_dir,
+                    record_history,
+                )
+                for start in range(n_starts)
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
 
     return results
 
 
+def array_to_shared_memory(array):
+    """
+    Copies array into a new shared memory block.
+    Returns the block and (name, shape, dtype) to attach to it in another process.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def run_cavi_from_shared_memory(
+    K,
+    alpha0,
+    alphabet,
+    shared_arrays,
+    reference_seq,
+    reads_list,
+    start_id,
+    output_dir,
+    record_history,
+):
+    """
+    Runs cavi in a worker process on the arrays placed in shared memory
+    by multistart_cavi.
+    """
+    shms = [shared_memory.SharedMemory(name=name) for name, _, _ in shared_arrays]
+    try:
+        reference_binary, reads_seq_binary, reads_weights = [
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            for shm, (_, shape, dtype) in zip(shms, shared_arrays)
+        ]
+        for read, seq_binary in zip(reads_list, reads_seq_binary):
+            read.seq_binary = seq_binary
+
+        return run_cavi(
+            K,
+            alpha0,
+            alphabet,
+            reference_binary,
+            reference_seq,
+            reads_list,
+            reads_seq_binary,
+            reads_weights,
+            start_id,
+            output_dir,
+            record_history,
+        )
+    finally:
+        # all views into the shared memory have to be released before closing it
+        for read in reads_list:
+            read.seq_binary = None
+        reference_binary = reads_seq_binary = reads_weights = None
+        for shm in shms:
+            shm.close()
+
+
 def run_cavi(
     K,
     alpha0,
@@ -94,17 +157,15 @@ def run_cavi(
     state_init_dict = initialization.draw_init_state(
         K, alpha0, alphabet, reads_list, reference_binary
     )
-    state_init_dict.update(
-        {
-            "lnB_alpha0": lnB(state_init_dict["alpha"]),
-            "betaln_a0_b0": betaln(
-                state_init_dict["gamma_a"], state_init_dict["gamma_b"]
-            ),
-            "betaln_c0_d0": betaln(
-                state_init_dict["theta_c"], state_init_dict["theta_d"]
-            ),
-        }
-    )
+    # prior parameters and the ELBO terms depending only on them are fixed
+    prior_alpha = state_init_dict["alpha"]
+    prior_gamma_a = state_init_dict["gamma_a"]
+    prior_gamma_b = state_init_dict["gamma_b"]
+    prior_theta_c = state_init_dict["theta_c"]
+    prior_theta_d = state_init_dict["theta_d"]
+    lnB_alpha0 = lnB(prior_alpha)
+    betaln_a0_b0 = betaln(prior_gamma_a, prior_gamma_b)
+    betaln_c0_d0 = betaln(prior_theta_c, prior_theta_d)
 
     # write initial values to dict
     dict_result.update(
@@ -135,27 +196,43 @@ def run_cavi(
             digamma_c_d_sum = digamma(
                 state_curr_dict["theta_c"] + state_curr_dict["theta_d"]
             )
-            state_curr_dict.update({"digamma_alpha_sum": digamma_alpha_sum})
-            state_curr_dict.update({"digamma_a_b_sum": digamma_a_b_sum})
-            state_curr_dict.update({"digamma_c_d_sum": digamma_c_d_sum})
 
-        state_curr_dict = update_eqs.update(
+        state_curr_dict, reads_haplo_part = update_eqs.update(
             reads_seq_binary,
             reads_weights,
             reads_list,
             reference_binary,
-            state_init_dict,
+            prior_alpha,
+            prior_gamma_a,
+            prior_gamma_b,
+            prior_theta_c,
+            prior_theta_d,
+            digamma_alpha_sum,
+            digamma_a_b_sum,
+            digamma_c_d_sum,
             state_curr_dict,
         )
         elbo = elbo_eqs.compute_elbo(
             reads_weights,
             reads_seq_binary,
             reference_binary,
-            state_init_dict,
+            prior_alpha,
+            prior_gamma_a,
+            prior_gamma_b,
+            prior_theta_c,
+            prior_theta_d,
+            lnB_alpha0,
+            betaln_a0_b0,
+            betaln_c0_d0,
             state_curr_dict,
+            reads_haplo_part=reads_haplo_part,
         )
 
         if iter % 2 == 0:
+            # the ELBO is compared with the previously recorded one, i.e. the
+            # one of two iterations before
+            if history_elbo:
+                prev_elbo = history_elbo[-1]
             history_elbo.append(elbo)
             history_mean_log_pi.append(state_curr_dict["mean_log_pi"])
             history_mean_log_gamma.append(state_curr_dict["mean_log_gamma"])
@@ -163,7 +240,8 @@ def run_cavi(
             history_mean_cluster.append(state_curr_dict["mean_cluster"])
 
         if iter > 1:
-            if np.isnan(elbo):
+            elbo_diff = abs(elbo - prev_elbo)
+            if math.isnan(elbo):
                 exit_message = "Error: ELBO is nan."
                 print(exit_message)
                 print("mean_log_pi is nan", np.any(np.isnan(state_curr_dict["mean_log_pi"])))
@@ -172,11 +250,11 @@ def run_cavi(
                 print("mean_cluster is nan", np.any(np.isnan(state_curr_dict["mean_cluster"])))
 
                 break
-            elif (history_elbo[-2] > elbo) and np.abs(elbo - history_elbo[-2]) > 1e-08:
+            elif (prev_elbo > elbo) and elbo_diff > 1e-08:
                 message = "Error: ELBO is decreasing."
                 exitflag = -1
                 break
-            elif np.abs(elbo - history_elbo[-2]) < 1e-03:
+            elif elbo_diff < 1e-03:
                 converged = True
                 iter += 1
                 message = "ELBO converged."
@@ -2,21 +2,25 @@ from scipy.special import betaln
 import numpy as np
 from scipy.stats._multivariate import _lnB as lnB
 
+from .preparation import einsum_reads
+
 
 def compute_elbo(
-    reads_weights, reads_seq_binary, reference_binary, state_init, state_curr
+    reads_weights,
+    reads_seq_binary,
+    reference_binary,
+    alpha0,
+    a,
+    b,
+    c,
+    d,
+    lnB_alpha0,
+    betaln_a0_b0,
+    betaln_c0_d0,
+    state_curr,
+    reads_haplo_part=None,
 ):
 
-    alpha0 = state_init["alpha"]
-    a = state_init["gamma_a"]
-    b = state_init["gamma_b"]
-    c = state_init["theta_c"]
-    d = state_init["theta_d"]
-
-    lnB_alpha0 = state_init["lnB_alpha0"]
-    betaln_a0_b0 = state_init["betaln_a0_b0"]
-    betaln_c0_d0 = state_init["betaln_c0_d0"]
-
     mean_z = state_curr["mean_cluster"]
     mean_h = state_curr["mean_haplo"]
 
@@ -31,7 +35,9 @@ def compute_elbo(
     d_updated = state_curr["theta_d"]
     mean_log_theta = state_curr["mean_log_theta"]
 
-    elbo = elbo_data(reads_weights, reads_seq_binary, mean_z, mean_h, mean_log_theta)
+    elbo = elbo_data(
+        reads_weights, reads_seq_binary, mean_z, mean_h, mean_log_theta, reads_haplo_part
+    )
     elbo += elbo_pi(alpha0, lnB_alpha0, alpha_updated, mean_log_pi)
     elbo += elbo_cluster(mean_z, mean_log_pi, reads_weights)
     elbo += elbo_haplo(reference_binary, mean_h, mean_log_gamma)
@@ -42,7 +48,12 @@ def compute_elbo(
 
 
 def elbo_data(
-    reads_weights, reads_seq_binary, mean_cluster, mean_haplo, mean_log_theta
+    reads_weights,
+    reads_seq_binary,
+    mean_cluster,
+    mean_haplo,
+    mean_log_theta,
+    reads_haplo_part=None,
 ):
     B = mean_haplo.shape[2]
 
@@ -50,11 +61,16 @@ def elbo_data(
     b2 = mean_log_theta[1] - np.log(B - 1)
 
     all_N_pos = reads_seq_binary.sum(axis=2) > 0
-    temp_sum = np.add(np.ones(reads_seq_binary.shape), (-1) * reads_seq_binary)
+    temp_sum = np.add(
+        np.ones(reads_seq_binary.shape, dtype=reads_seq_binary.dtype), (-1) * reads_seq_binary
+    )
 
     reads_seq_binary_inv = np.einsum("NL,NLB->NLB", all_N_pos, temp_sum)
-    temp_c = np.einsum("NLB,KLB->NK", b1 * reads_seq_binary, mean_haplo)
-    temp_c += np.einsum("NLB,KLB->NK", b2 * reads_seq_binary_inv, mean_haplo)
+    # can be passed if already computed for the update of theta
+    if reads_haplo_part is None:
+        reads_haplo_part = einsum_reads("NLB,KLB->NK", reads_seq_binary, mean_haplo)
+    temp_c = b1 * reads_haplo_part
+    temp_c += b2 * einsum_reads("NLB,KLB->NK", reads_seq_binary_inv, mean_haplo)
 
     mean_cluster_weight = np.einsum("N,NK->NK", reads_weights, mean_cluster)
 
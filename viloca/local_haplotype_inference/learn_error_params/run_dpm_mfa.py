@@ -39,8 +39,8 @@ def main(freads_in, fref_in, output_dir, n_starts, K, alpha0, alphabet="ACGT-",
     # Read in reads
     reference_seq, ref_id = preparation.load_reference_seq(fref_in)
     reference_binary = preparation.reference2binary(reference_seq, alphabet)
-    reads_list = preparation.load_fasta2reads_list(freads_in, alphabet, unique_modus)
-    reads_seq_binary, reads_weights = preparation.reads_list_to_array(reads_list)
+    reads_list = preparation.load_fasta2reads_list(freads_in, unique_modus)
+    reads_seq_binary, reads_weights = preparation.reads_list_to_array(reads_list, alphabet)
 
     if n_starts >1:
         result_list = cavi.multistart_cavi(
@@ -1,32 +1,34 @@
 from scipy.special import digamma
 import numpy as np
 
+from .preparation import einsum_reads
+
 
 def update(
     reads_seq_binary,
     reads_weights,
     reads_list,
     reference_binary,
-    state_init,
+    alpha0,
+    a,
+    b,
+    c,
+    d,
+    digamma_alpha_sum,
+    digamma_a_b_sum,
+    digamma_c_d_sum,
     state_curr,
 ):
-
-    # sssstart_time = timer()
-    alpha0 = state_init["alpha"]
-    a = state_init["gamma_a"]
-    b = state_init["gamma_b"]
-    c = state_init["theta_c"]
-    d = state_init["theta_d"]
-
+    """
+    Returns the updated state and the overlap of the reads with the updated
+    haplotypes (dimension: NxK), which can be passed on to
+    elbo_eqs.compute_elbo.
+    """
     mean_z = state_curr["mean_cluster"]
     mean_h = state_curr["mean_haplo"]
 
-    # alpha_updated = state_curr['alpha']
     mean_log_pi = state_curr["mean_log_pi"]
-    digamma_alpha_sum = state_curr["digamma_alpha_sum"]
     mean_log_gamma = state_curr["mean_log_gamma"]
-    digamma_a_b_sum = state_curr["digamma_a_b_sum"]
-    digamma_c_d_sum = state_curr["digamma_c_d_sum"]
     mean_log_theta = state_curr["mean_log_theta"]
 
     mean_h = update_mean_haplo(
@@ -45,8 +47,16 @@ def update(
     a_updated, b_updated = update_a_and_b(reference_binary, mean_h, a, b)
     mean_log_gamma = get_mean_log_beta_dist(a_updated, b_updated, digamma_a_b_sum)
 
+    reads_haplo_part = einsum_reads("NLB,KLB->NK", reads_seq_binary, mean_h)
     c_updated, d_updated = update_c_and_d(
-        reads_seq_binary, reads_weights, reads_list, mean_z, mean_h, c, d
+        reads_seq_binary,
+        reads_weights,
+        reads_list,
+        mean_z,
+        mean_h,
+        c,
+        d,
+        reads_haplo_part,
     )
     mean_log_theta = get_mean_log_beta_dist(c_updated, d_updated, digamma_c_d_sum)
     state_curr_dict_new = dict(
@@ -58,16 +68,13 @@ def update(
             "mean_log_theta": mean_log_theta,
             "gamma_a": a_updated,
             "gamma_b": b_updated,
-            "digamma_alpha_sum": digamma_alpha_sum,
-            "digamma_c_d_sum": digamma_c_d_sum,
-            "digamma_a_b_sum": digamma_a_b_sum,
             "mean_log_gamma": mean_log_gamma,
             "mean_haplo": mean_h,
             "mean_cluster": mean_z,
         }
     )
 
-    return state_curr_dict_new
+    return state_curr_dict_new, reads_haplo_part
 
 
 def get_mean_log_pi(alpha, digamma_alpha_sum):
@@ -95,8 +102,8 @@ def update_mean_cluster(
     temp_haplo_k = mean_log_theta[0] * mean_haplo
     temp_haplo_k_inv = (mean_log_theta[1] - np.log(B - 1)) * mean_haplo
 
-    temp_c = np.einsum("NLB,KLB->NK", reads_seq_binary, temp_haplo_k)
-    temp_c += np.einsum("NLB,KLB->NK", (1 - reads_seq_binary), temp_haplo_k_inv)
+    temp_c = einsum_reads("NLB,KLB->NK", reads_seq_binary, temp_haplo_k)
+    temp_c += einsum_reads("NLB,KLB->NK", (1 - reads_seq_binary), temp_haplo_k_inv)
     temp_c[:] += mean_log_pi
 
     del temp_haplo_k
@@ -131,7 +138,9 @@ def update_mean_haplo(
     all_N_pos = (
         reads_seq_binary.sum(axis=2) > 0
     )  # if reads_list[n].seq_binary[l].sum(axis=0)=0 then "N" at position l then position l is ignored
-    temp_sum = np.add(np.ones(reads_seq_binary.shape), (-1) * reads_seq_binary)
+    temp_sum = np.add(
+        np.ones(reads_seq_binary.shape, dtype=reads_seq_binary.dtype), (-1) * reads_seq_binary
+    )
     reads_seq_binary_inv = np.einsum("NL,NLB->NLB", all_N_pos, temp_sum)
 
     del all_N_pos
@@ -139,10 +148,10 @@ def update_mean_haplo(
 
     mean_cluster_weight = np.einsum("N,NK->NK", reads_weights, mean_cluster)
 
-    log_mean_haplo = b1 * np.einsum(
+    log_mean_haplo = b1 * einsum_reads(
         "NLB,NK->KLB", reads_seq_binary, mean_cluster_weight
     )  # shape: (K,L,B)
-    log_mean_haplo += b2 * np.einsum(
+    log_mean_haplo += b2 * einsum_reads(
         "NLB,NK->KLB", reads_seq_binary_inv, mean_cluster_weight
     )
     log_mean_haplo[:] += ref_part
@@ -172,17 +181,25 @@ def update_a_and_b(reference_table, mean_haplo, a, b):
 
 
 def update_c_and_d(
-    reads_seq_binary, reads_weights, reads_list, mean_cluster, mean_haplo, c, d
+    reads_seq_binary,
+    reads_weights,
+    reads_list,
+    mean_cluster,
+    mean_haplo,
+    c,
+    d,
+    reads_haplo_part=None,
 ):
 
     mean_cluster_weight = np.einsum("N,NK->NK", reads_weights, mean_cluster)
 
     up_c = c.copy()
-    temp_c = np.einsum("NLB,KLB->NK", reads_seq_binary, mean_haplo)
-    up_c += np.einsum("NK,NK->", temp_c, mean_cluster_weight)
+    if reads_haplo_part is None:
+        reads_haplo_part = einsum_reads("NLB,KLB->NK", reads_seq_binary, mean_haplo)
+    up_c += np.einsum("NK,NK->", reads_haplo_part, mean_cluster_weight)
 
     up_d = d.copy()
-    temp_c = np.einsum("NLB,KLB->NK", reads_seq_binary, (1 - mean_haplo))
+    temp_c = einsum_reads("NLB,KLB->NK", reads_seq_binary, (1 - mean_haplo))
     up_d += np.einsum("NK,NK->", temp_c, mean_cluster_weight)
 
     return up_c, up_d
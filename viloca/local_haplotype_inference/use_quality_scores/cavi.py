@@ -1,5 +1,10 @@
+import copy
+import itertools
+import math
 import numpy as np
 import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
 from scipy.special import digamma
 from scipy.stats._multivariate import _lnB as lnB
 from scipy.special import betaln
@@ -9,18 +14,6 @@ from . import initialization
 from . import update_eqs
 from . import elbo_eqs
 
-"""
-Parallelizing with Pool following:
-https://www.machinelearningplus.com/python/parallel-processing-python/
-"""
-
-results = []
-
-
-def collect_result(result):
-    global results
-    results.append(result)
-
 
 def multistart_cavi(
     n_cluster,
@@ -37,33 +30,112 @@ def multistart_cavi(
     record_history
 ):
 
-    pool = mp.Pool(mp.cpu_count())
-    for start in range(n_starts):
-        pool.apply_async(
-            run_cavi,
-            args=(
-                n_cluster,
-                alpha0,
-                alphabet,
-                reference_binary,
-                reads_list,
-                reads_seq_binary,
-                reads_weights,
-                reads_log_error_proba,
-                start,
-                output_dir,
-                convergence_threshold,
-                record_history
-            ),
-            callback=collect_result,
-        )
+    # the large arrays are placed in shared memory once instead of being
+    # pickled for every start
+    shms = []
+    shared_arrays = []
+    for array in [reference_binary, reads_seq_binary, reads_weights, reads_log_error_proba]:
+        shm, shared_array = array_to_shared_memory(array)
+        shms.append(shm)
+        shared_arrays.append(shared_array)
+    # the seq_binary of the reads are views into reads_seq_binary
+    # and the qualities are only needed for reads_log_error_proba, so the
+    # copies sent to the workers keep only what run_cavi uses
+    reads_list = [copy.copy(read) for read in reads_list]
+    for read in reads_list:
+        read.seq_binary = None
+        read.phred_quality_score = None
+        read.seq_string = str(read.seq_string)
 
-    pool.close()
-    pool.join()
+    try:
+        n_workers = min(mp.cpu_count(), n_starts)
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [
+                executor.submit(
+                    run_cavi_from_shared_memory,
+                    n_cluster,
+                    alpha0,
+                    alphabet,
+                    shared_arrays,
+                    reads_list,
+                    start,
+                    output_dir,
+                    convergence_threshold,
+                    record_history,
+                )
+                for start in range(n_starts)
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
 
     return results
 
 
+def array_to_shared_memory(array):
+    """
+    Copies array into a new shared memory block.
+    Returns the block and (name, shape, dtype) to attach to it in another process.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def run_cavi_from_shared_memory(
+    n_cluster,
+    alpha0,
+    alphabet,
+    shared_arrays,
+    reads_list,
+    start_id,
+    output_dir,
+    convergence_threshold,
+    record_history,
+):
+    """
+    Runs cavi in a worker process on the arrays placed in shared memory
+    by multistart_cavi.
+    """
+    shms = [shared_memory.SharedMemory(name=name) for name, _, _ in shared_arrays]
+    try:
+        (
+            reference_binary,
+            reads_seq_binary,
+            reads_weights,
+            reads_log_error_proba,
+        ) = [
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            for shm, (_, shape, dtype) in zip(shms, shared_arrays)
+        ]
+        for read, seq_binary in zip(reads_list, reads_seq_binary):
+            read.seq_binary = seq_binary
+
+        return run_cavi(
+            n_cluster,
+            alpha0,
+            alphabet,
+            reference_binary,
+            reads_list,
+            reads_seq_binary,
+            reads_weights,
+            reads_log_error_proba,
+            start_id,
+            output_dir,
+            convergence_threshold,
+            record_history,
+        )
+    finally:
+        # all views into the shared memory have to be released before closing it
+        for read in reads_list:
+            read.seq_binary = None
+        reference_binary = reads_seq_binary = reads_weights = reads_log_error_proba = None
+        for shm in shms:
+            shm.close()
+
+
 def run_cavi(
     n_cluster,
     alpha0,
@@ -92,14 +164,12 @@ def run_cavi(
     state_init_dict = initialization.draw_init_state(
         n_cluster, alpha0, alphabet, reads_list, reference_binary
     )
-    state_init_dict.update(
-        {
-            "lnB_alpha0": lnB(state_init_dict["alpha"]),
-            "betaln_a0_b0": betaln(
-                state_init_dict["gamma_a"], state_init_dict["gamma_b"]
-            ),
-        }
-    )
+    # prior parameters and the ELBO terms depending only on them are fixed
+    prior_alpha = state_init_dict["alpha"]
+    prior_gamma_a = state_init_dict["gamma_a"]
+    prior_gamma_b = state_init_dict["gamma_b"]
+    lnB_alpha0 = lnB(prior_alpha)
+    betaln_a0_b0 = betaln(prior_gamma_a, prior_gamma_b)
 
     if record_history:
         history_alpha = [state_init_dict["alpha"]]
@@ -109,62 +179,69 @@ def run_cavi(
     history_elbo = []
 
     # Iteratively update mean values
-    iter = 0
     converged = False
     elbo = 0
     state_curr_dict = state_init_dict
     min_number_iterations = 10
-    while (converged is False) or (iter < min_number_iterations):
+    for iter in itertools.count():
+        if converged and iter >= min_number_iterations:
+            break
 
+        # after the first update the sums of alpha and of gamma_a, gamma_b
+        # do not change anymore
         if iter <= 1:
             digamma_alpha_sum = digamma(state_curr_dict["alpha"].sum(axis=0))
             digamma_a_b_sum = digamma(
                 state_curr_dict["gamma_a"] + state_curr_dict["gamma_b"]
             )
-            state_curr_dict.update({"digamma_alpha_sum": digamma_alpha_sum})
-            state_curr_dict.update({"digamma_a_b_sum": digamma_a_b_sum})
 
-        state_curr_dict = update_eqs.update(
-            reads_seq_binary,
+        state_curr_dict, haplo_error_rate_part = update_eqs.update(
             reads_weights,
             reference_binary,
             reads_log_error_proba,
-            state_init_dict,
+            prior_alpha,
+            prior_gamma_a,
+            prior_gamma_b,
+            digamma_alpha_sum,
+            digamma_a_b_sum,
             state_curr_dict,
         )
         elbo = elbo_eqs.compute_elbo(
             reads_weights,
             reference_binary,
             reads_log_error_proba,
-            state_init_dict,
+            prior_alpha,
+            prior_gamma_a,
+            prior_gamma_b,
+            lnB_alpha0,
+            betaln_a0_b0,
             state_curr_dict,
+            haplo_error_rate_part=haplo_error_rate_part,
         )
 
+        history_elbo.append(elbo)
         if (iter % 2 == 0) and record_history:
-            history_elbo.append(elbo)
             history_mean_log_pi.append(state_curr_dict["mean_log_pi"])
             history_mean_log_gamma.append(state_curr_dict["mean_log_gamma"])
             history_mean_cluster.append(state_curr_dict["mean_cluster"])
-        else:
-            history_elbo.append(elbo)
 
         if iter > 1:
-            if np.isnan(elbo):
+            elbo_diff = abs(elbo - prev_elbo)
+            if math.isnan(elbo):
                 print("elbo ", elbo)
                 exit_message = "Error: ELBO is nan."
                 print(exit_message)
                 break
-            elif (history_elbo[-2] > elbo) and np.abs(elbo - history_elbo[-2]) > 1e-08:
+            elif (prev_elbo > elbo) and elbo_diff > 1e-08:
                 exit_message = "Error: ELBO is decreasing."
                 break
-            elif np.abs(elbo - history_elbo[-2]) < convergence_threshold:
+            elif elbo_diff < convergence_threshold:
                 converged = True
                 exit_message = "ELBO converged."
 
+        prev_elbo = elbo
         state_curr_dict.update({"elbo": elbo})
-
-        iter += 1
-    # End: While-loop
+    # End: For-loop
 
     state_curr_dict.update({"elbo": elbo})
 
@@ -2,18 +2,22 @@ from scipy.special import betaln
 import numpy as np
 from scipy.stats._multivariate import _lnB as lnB
 
+from .preparation import einsum_reads
+
 
 def compute_elbo(
-    reads_weights, reference_binary, reads_log_error_proba, state_init, state_curr
+    reads_weights,
+    reference_binary,
+    reads_log_error_proba,
+    alpha0,
+    a,
+    b,
+    lnB_alpha0,
+    betaln_a0_b0,
+    state_curr,
+    haplo_error_rate_part=None,
 ):
 
-    alpha0 = state_init["alpha"]
-    a = state_init["gamma_a"]
-    b = state_init["gamma_b"]
-
-    lnB_alpha0 = state_init["lnB_alpha0"]
-    betaln_a0_b0 = state_init["betaln_a0_b0"]
-
     mean_z = state_curr["mean_cluster"]
     mean_h = state_curr["mean_haplo"]
 
@@ -24,7 +28,9 @@ def compute_elbo(
     b_updated = state_curr["gamma_b"]
     mean_log_gamma = state_curr["mean_log_gamma"]
 
-    elbo = elbo_data(reads_weights, mean_z, mean_h, reads_log_error_proba)
+    elbo = elbo_data(
+        reads_weights, mean_z, mean_h, reads_log_error_proba, haplo_error_rate_part
+    )
     elbo += elbo_pi(alpha0, lnB_alpha0, alpha_updated, mean_log_pi)
     elbo += elbo_cluster(mean_z, mean_log_pi, reads_weights)
     elbo += elbo_haplo(reference_binary, mean_h, mean_log_gamma)
@@ -33,9 +39,17 @@ def compute_elbo(
     return elbo
 
 
-def elbo_data(reads_weights, mean_cluster, mean_haplo, reads_log_error_proba):
+def elbo_data(
+    reads_weights,
+    mean_cluster,
+    mean_haplo,
+    reads_log_error_proba,
+    haplo_error_rate_part=None,
+):
 
-    haplo_error_rate_part = np.einsum("NLB,KLB->NK", reads_log_error_proba, mean_haplo)
+    # can be passed if already computed for the update of mean_cluster
+    if haplo_error_rate_part is None:
+        haplo_error_rate_part = einsum_reads("NLB,KLB->NK", reads_log_error_proba, mean_haplo)
     mean_cluster_weight = np.einsum("N,NK->NK", reads_weights, mean_cluster)
     final = np.einsum("NK,NK->", mean_cluster_weight, haplo_error_rate_part)
 
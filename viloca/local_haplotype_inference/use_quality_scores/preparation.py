@@ -1,6 +1,9 @@
+from functools import lru_cache
+
 import numpy as np
 from Bio import SeqIO
-from scipy.spatial.distance import hamming
+
+from ...fasta import read_fasta
 
 
 class Read:
@@ -14,14 +17,29 @@ class Read:
         self.idx_identical_reads = []
         self.n_non_N = len(seq_string) - seq_string.count("N")
 
-    def seq2binary(self, alphabet):
-        length_seq = len(self.seq_string)
-        seq_table = np.zeros((length_seq, len(alphabet)))
-        for base_position, base in enumerate(str(self.seq_string)):
-            if alphabet.find(base) >= 0:
-                seq_table[base_position][alphabet.index(base)] = 1
 
-        self.seq_binary = seq_table
+@lru_cache(maxsize=None)
+def alphabet_lookup_table(alphabet):
+    """
+    Maps every byte value to the index of that character in the alphabet.
+    Characters not in the alphabet (e.g. "N") map to len(alphabet).
+    """
+    lookup_table = np.full(256, len(alphabet), dtype=np.uint8)
+    lookup_table[np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)] = np.arange(
+        len(alphabet), dtype=np.uint8
+    )
+    return lookup_table
+
+
+def seq2onehot(seq, alphabet, dtype=np.float64):
+    """
+    One-hot encoding of seq, dimension: L x B.
+    Positions with characters not in the alphabet are all zero.
+    """
+    codes = alphabet_lookup_table(alphabet)[
+        np.frombuffer(str(seq).encode("ascii"), dtype=np.uint8)
+    ]
+    return (codes[:, np.newaxis] == np.arange(len(alphabet))).astype(dtype)
 
 
 def compute_reads_log_error_matrix(
@@ -84,13 +102,27 @@ def compute_reads_log_error_proba(qualities, reads_seq_binary, size_alphabet):
     # write zero where there is an "N"  in the position
     final[~all_N_pos] = 0
 
-    return final  # dimension: NxLxB
-
+    return final.astype(np.float32)  # dimension: NxLxB
 
-def reads_list_to_array(reads_list):
 
-    reads_binary = [reads_list[n].seq_binary for n in range(len(reads_list))]
-    reads_binary_array = np.asarray(reads_binary)
+def reads_list_to_array(reads_list, alphabet):
+    """
+    One-hot encoding of all reads in a single contiguous array of dimension
+    N x L x B. The seq_binary of each read is a view into this array.
+    """
+    read_lengths = {len(read.seq_string) for read in reads_list}
+    if len(read_lengths) > 1:
+        raise ValueError(
+            "all reads must have the same length, found lengths %s"
+            % sorted(read_lengths)
+        )
+    reads_binary_array = seq2onehot(
+        "".join([str(read.seq_string) for read in reads_list]),
+        alphabet,
+        dtype=np.float32,
+    ).reshape(len(reads_list), -1, len(alphabet))
+    for read, seq_binary in zip(reads_list, reads_binary_array):
+        read.seq_binary = seq_binary
 
     reads_weights = [reads_list[n].weight for n in range(len(reads_list))]
     reads_weights_array = np.asarray(reads_weights)
@@ -98,7 +130,35 @@ def reads_list_to_array(reads_list):
     return reads_binary_array, reads_weights_array
 
 
-def load_fasta_and_qualities(fname_fasta, fname_qualities, alphabet,unique_modus):
+def einsum_reads(subscripts, reads_array, params):
+    """
+    np.einsum of a per-read array of dimension N x L x B (stored as float32)
+    with a parameter array, accumulated in float64. The reads are cast to
+    float64 in chunks of reads, so no float64 copy of the whole array is
+    made. If the output has an N axis it has to be the first one, as for
+    the params if they have one.
+    """
+    params_subscripts = subscripts.split("->")[0].split(",")[1]
+    output_subscripts = subscripts.split("->")[1]
+    n_reads_chunk = max(1, 2**20 // max(1, reads_array[0].size))
+
+    parts = []
+    for start in range(0, reads_array.shape[0], n_reads_chunk):
+        chunk = slice(start, start + n_reads_chunk)
+        parts.append(
+            np.einsum(
+                subscripts,
+                reads_array[chunk].astype(np.float64),
+                params[chunk] if params_subscripts[0] == "N" else params,
+                optimize=True,
+            )
+        )
+    if output_subscripts[:1] == "N":
+        return np.concatenate(parts)
+    return np.sum(parts, axis=0)
+
+
+def load_fasta_and_qualities(fname_fasta, fname_qualities, unique_modus):
 
     with open(fname_qualities, "rb") as f:
         qualities = np.load(f, allow_pickle=True)
@@ -107,7 +167,6 @@ def load_fasta_and_qualities(fname_fasta, fname_qualities, alphabet,unique_modus
     reads_list = []
     for idx, seq in enumerate(SeqIO.parse(fname_fasta, "fasta")):
         reads_list.append(Read(seq.seq, seq.id))
-        reads_list[-1].seq2binary(alphabet)
         reads_list[-1].phred_quality_score = qualities[idx]
 
     if unique_modus:
@@ -118,25 +177,22 @@ def load_fasta_and_qualities(fname_fasta, fname_qualities, alphabet,unique_modus
 
 
 def unique_reads_list(reads_list):
-    # test for unique reads_list
-    for i, temp_read in enumerate(reads_list):
-        if temp_read.weight > 0.0:
-            for j in range(i + 1, len(reads_list)):
-                hd = hamming(
-                    temp_read.seq_string, reads_list[j].seq_string
-                )
-                if hd == 0:
-                    temp_read.weight += 1
-                    temp_read.identical_reads.append(reads_list[j].id)
-                    temp_read.phred_quality_score = (
-                        temp_read.phred_quality_score
-                        + reads_list[j].phred_quality_score
-                    ) / 2
-                    reads_list[j].weight -= 1
+    # identical reads are merged into the first read with that sequence
+    unique_reads = {}
+    for temp_read in reads_list:
+        seq_string = str(temp_read.seq_string)
+        first_read = unique_reads.get(seq_string)
+        if first_read is None:
+            unique_reads[seq_string] = temp_read
+        else:
+            first_read.weight += 1
+            first_read.identical_reads.append(temp_read.id)
+            first_read.phred_quality_score = (
+                first_read.phred_quality_score + temp_read.phred_quality_score
+            ) / 2
 
     # keep only unique reads_list
-    reads_list = [read for read in reads_list if read.weight > 0]
-    return reads_list
+    return list(unique_reads.values())
 
 
 def check_qualities(qualities):
@@ -150,14 +206,10 @@ def get_qualities(reads_list):
 
 
 def load_reference_seq(reference_file, alphabet):
-    for seq in SeqIO.parse(reference_file, "fasta"):
-        return reference2binary(seq.seq, alphabet), seq.id
+    with open(reference_file) as f:
+        for seq_id, _, seq in read_fasta(f):
+            return reference2binary(seq, alphabet), seq_id
 
 
 def reference2binary(reference_seq, alphabet):
-    length_seq = len(reference_seq)
-    reference_table = np.zeros((length_seq, len(alphabet)))
-    for base_position, base in enumerate(str(reference_seq)):
-        if alphabet.find(base) >= 0:
-            reference_table[base_position][alphabet.index(base.upper())] = 1
-    return reference_table
+    return seq2onehot(reference_seq, alphabet)
@@ -47,9 +47,9 @@ def main(
     reference_binary, ref_id = preparation.load_reference_seq(fref_in, alphabet)
 
     reads_list, qualities = preparation.load_fasta_and_qualities(
-        freads_in, fname_qualities, alphabet, unique_modus
+        freads_in, fname_qualities, unique_modus
     )
-    reads_seq_binary, reads_weights = preparation.reads_list_to_array(reads_list)
+    reads_seq_binary, reads_weights = preparation.reads_list_to_array(reads_list, alphabet)
     reads_log_error_proba = preparation.compute_reads_log_error_proba(
         qualities, reads_seq_binary, len(alphabet)
     )
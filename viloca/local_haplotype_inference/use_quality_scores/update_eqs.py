@@ -2,23 +2,32 @@ from scipy.special import digamma
 from scipy.special import betaln
 import numpy as np
 
-def update(reads_seq_binary, reads_weights, reference_binary, reads_log_error_proba, state_init, state_curr):
-
-    #sssstart_time = timer()
-    alpha0 = state_init['alpha']
-    a = state_init['gamma_a']
-    b = state_init['gamma_b']
+from .preparation import einsum_reads
 
+def update(
+    reads_weights,
+    reference_binary,
+    reads_log_error_proba,
+    alpha0,
+    a,
+    b,
+    digamma_alpha_sum,
+    digamma_a_b_sum,
+    state_curr,
+):
+    """
+    Returns the updated state and the expected log-likelihood of the reads
+    given the updated haplotypes (dimension: NxK), which can be passed on to
+    elbo_eqs.compute_elbo.
+    """
     mean_z = state_curr['mean_cluster']
     mean_h = state_curr['mean_haplo']
 
-    #alpha_updated = state_curr['alpha']
     mean_log_pi = state_curr['mean_log_pi']
-    digamma_alpha_sum = state_curr['digamma_alpha_sum']
     mean_log_gamma = state_curr['mean_log_gamma']
-    digamma_a_b_sum=state_curr['digamma_a_b_sum']
     mean_h = update_mean_haplo(reads_weights,reference_binary, reads_log_error_proba, mean_z, mean_log_gamma)
-    mean_z = update_mean_cluster(mean_log_pi,mean_h,reads_log_error_proba)
+    haplo_error_rate_part = einsum_reads('NLB,KLB->NK', reads_log_error_proba, mean_h)
+    mean_z = get_mean_cluster(mean_log_pi,haplo_error_rate_part)
     alpha_updated = update_alpha(alpha0, mean_z,reads_weights)
     mean_log_pi = get_mean_log_pi(alpha_updated, digamma_alpha_sum)
     a_updated,b_updated = update_a_and_b(reference_binary,mean_h,a,b)
@@ -28,14 +37,12 @@ def update(reads_seq_binary, reads_weights, reference_binary, reads_log_error_pr
                             'mean_log_pi': mean_log_pi,
                             'gamma_a': a_updated,
                             'gamma_b': b_updated,
-                            'digamma_alpha_sum':digamma_alpha_sum,
-                            'digamma_a_b_sum':digamma_a_b_sum,
                             'mean_log_gamma': mean_log_gamma,
                             'mean_haplo': mean_h,
                             'mean_cluster': mean_z
                             })
 
-    return state_curr_dict_new
+    return state_curr_dict_new, haplo_error_rate_part
 
 def get_mean_log_pi(alpha, digamma_alpha_sum):
     """
@@ -52,14 +59,9 @@ def get_mean_log_beta_dist(a,b,digamma_sum):
     mean_log_gamma_inv = digamma(b)-digamma_sum
     return mean_log_gamma, mean_log_gamma_inv
 
-def update_mean_cluster(mean_log_pi,mean_haplo,reads_log_error_proba):
-
-    haplo_error_rate_part = np.einsum('NLB,KLB->NK', reads_log_error_proba, mean_haplo)
-
-    temp_c = haplo_error_rate_part
-    temp_c[:] += mean_log_pi
+def get_mean_cluster(mean_log_pi, haplo_error_rate_part):
 
-    del haplo_error_rate_part
+    temp_c = haplo_error_rate_part + mean_log_pi
 
     max_z = np.max(temp_c, axis=1)
     max_z = max_z[:, np.newaxis]
@@ -82,7 +84,7 @@ def update_mean_haplo(
     ref_part = reference_table*mean_log_gamma[0]+(1-reference_table)*(mean_log_gamma[1]-np.log(B-1))
 
     mean_cluster_weight = np.einsum('N,NK->NK',reads_weights,mean_cluster)
-    cluster_assignment_part = np.einsum('NLB,NK->KLB', reads_log_error_proba, mean_cluster_weight)
+    cluster_assignment_part = einsum_reads('NLB,NK->KLB', reads_log_error_proba, mean_cluster_weight)
 
     log_mean_haplo = cluster_assignment_part # shape: (K,L,B)
     log_mean_haplo[:] += ref_part
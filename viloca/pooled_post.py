@@ -117,13 +117,12 @@ def recalculate_posterior_and_ave_reads(fref_in: str, freads_in: str,
         reads_list, qualities = uqs_preparation.load_fasta_and_qualities(
             freads_in, # N_s - filter for sample
             fname_qualities,
-            alphabet,
             unique_modus
         )
     else:
-        reads_list = lep_preparation.load_fasta2reads_list(freads_in, alphabet, unique_modus)
+        reads_list = lep_preparation.load_fasta2reads_list(freads_in, unique_modus)
 
-    reads_seq_binary, reads_weights = uqs_preparation.reads_list_to_array(reads_list)
+    reads_seq_binary, reads_weights = uqs_preparation.reads_list_to_array(reads_list, alphabet)
 
     assert sum(reads_weights) == len(reads_list)
 
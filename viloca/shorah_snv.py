@@ -44,17 +44,15 @@
     ------------
 """
 
-import glob
 import os
 import sys
 import warnings
 import pandas as pd
 from collections import namedtuple
 from dataclasses import dataclass
+from functools import lru_cache
 import logging
 import numpy as np
-from Bio import SeqIO
-from re import search
 from math import log10
 import csv
 import inspect
@@ -62,6 +60,8 @@ from datetime import date
 
 import libshorah
 
+from .fasta import read_fasta
+
 SNP_id = namedtuple("SNP_id", [
     "pos", # a positon in (extended) reference space
     "var" # the variant
@@ -81,19 +81,23 @@ class SNV:
 standard_header_row = ["Chromosome", "Pos", "Ref", "Var", "Frq", "Pst"]
 
 
+def _parse_support_header(record_id, description):
+    """Returns haplotype name, posterior and average number of reads from the
+    id and header of a record in a reads-support file, e.g.
+    'hap_0|posterior=1' and 'hap_0|posterior=1 ave_reads=18'
+    """
+    _, _, post_and_av = description.partition("posterior=")
+    post, _, av = post_and_av.partition("ave_reads=")
+    return record_id.split("|", 1)[0], float(post), float(av)
+
+
 def _deletion_length(seq, char):
     """Determines the length of the deletion. Note that a sequence migth have
     more than one deletion
     seq: substring of the reconstructed haplotype
     char: character that is used to mark a deletion
     """
-    count = 0
-    for c in seq:
-        if c == char:
-            count += 1
-        else:
-            break
-    return count
+    return len(seq) - len(seq.lstrip(char))
 
 def _count_double_X(ref, seq, x):
     for i in reversed(range(x + 1)):
@@ -101,93 +105,102 @@ def _count_double_X(ref, seq, x):
             return x - i
     return 0
 
+@lru_cache(maxsize=1)
+def _encode_reference(ref):
+    """Returns ref as uint8 array and the number of "X" in ref before each
+    position. All haplotypes of a window are compared to the same ref.
+    """
+    ref_u8 = np.frombuffer(ref.encode("ascii"), dtype=np.uint8)
+    is_X = ref_u8 == ord("X")
+    return ref_u8, np.cumsum(is_X) - is_X
+
 def _preprocess_seq_with_X(ref, seq):
-    for idx, v in enumerate(seq):
-        if v == "-" and ref[idx] == "X":
-            seq = seq[:idx] + "X" + seq[idx+1:]
-            assert len(seq) == len(ref)
-    return seq
+    ref_u8, _ = _encode_reference(ref)
+    seq_u8 = np.frombuffer(seq.encode("ascii"), dtype=np.uint8)
+    assert len(seq_u8) == len(ref_u8)
+    seq_u8 = np.where((seq_u8 == ord("-")) & (ref_u8 == ord("X")), ord("X"), seq_u8)
+    return seq_u8.astype(np.uint8).tobytes().decode("ascii")
 
 def _compare_ref_to_read(ref: str, seq: str, start, snp, av, post, chrom, haplotype_id):
     assert len(ref) == len(seq)
 
-    pos = start
     tot_snv = 0
     aux_del = -1
 
-    change_in_reference_space = 0
-
-    for idx, v in enumerate(ref):  # iterate on the reference
-
-        if v != seq[idx]:  # SNV detected, save it
-            assert not (v != "X" and seq[idx] == "X")
-
-            if seq[idx] == "-" or v == "X": # TODO what is if window starts like that?
-                char = "-"
-                relevant_seq = seq
-                secondary_seq = ref
-                if v == "X":
-                    char = "X"
-                    relevant_seq = ref
-                    secondary_seq = seq
-                # Avoid counting multiple times a long deletion in the same haplotype
-                if idx > aux_del:
-                    tot_snv += 1
-                    # Check for gap characters and get the deletion
-                    # length
-                    del_len = _deletion_length(relevant_seq[idx:], char)
-                    aux_del = idx + del_len
-                    snp_id = SNP_id(
-                        pos=pos, var=seq[idx:aux_del]
-                    )
-
-                    if snp_id in snp:
-                        # Aggregate counts for long deletions which
-                        # are observed in multiple haplotypes
-                        snp[snp_id].freq += av
-                        snp[snp_id].support += post * av
-                    else:
-                        # Report preceeding position as well
-                        pos_prev = pos - 1
-                        num_double_X = _count_double_X(ref, seq, pos_prev - start)
-                        secondary_seq = secondary_seq[pos_prev - start - num_double_X] + secondary_seq[
-                            (pos - start) : (pos_prev + del_len - start + 1)
-                        ] # TODO pos_prev - 1 - beg might be out of range
-
-                        snp[snp_id] = SNV(
-                            chrom,
-                            haplotype_id,
-                            pos_prev - change_in_reference_space,
-                            ref[pos_prev - start - num_double_X] if v =="X" else secondary_seq,
-                            secondary_seq if v =="X" else relevant_seq[pos_prev - start - num_double_X],
-                            av,
-                            post * av,
-                        )
-            else:
+    # n_X_before: number of "X" in the reference before each position
+    ref_u8, n_X_before = _encode_reference(ref)
+    seq_u8 = np.frombuffer(seq.encode("ascii"), dtype=np.uint8)
+
+    # only visit the positions where read and reference differ
+    for idx in np.flatnonzero(ref_u8 != seq_u8).tolist():
+        v = ref[idx]
+        pos = start + idx
+        change_in_reference_space = int(n_X_before[idx])
+
+        # SNV detected, save it
+        assert not (v != "X" and seq[idx] == "X")
+
+        if seq[idx] == "-" or v == "X": # TODO what is if window starts like that?
+            char = "-"
+            relevant_seq = seq
+            secondary_seq = ref
+            if v == "X":
+                char = "X"
+                relevant_seq = ref
+                secondary_seq = seq
+            # Avoid counting multiple times a long deletion in the same haplotype
+            if idx > aux_del:
                 tot_snv += 1
-                snp_id = SNP_id(pos=pos, var=seq[idx])
+                # Check for gap characters and get the deletion
+                # length
+                del_len = _deletion_length(relevant_seq[idx:], char)
+                aux_del = idx + del_len
+                snp_id = SNP_id(
+                    pos=pos, var=seq[idx:aux_del]
+                )
+
                 if snp_id in snp:
+                    # Aggregate counts for long deletions which
+                    # are observed in multiple haplotypes
                     snp[snp_id].freq += av
                     snp[snp_id].support += post * av
                 else:
+                    # Report preceeding position as well
+                    pos_prev = pos - 1
+                    num_double_X = _count_double_X(ref, seq, pos_prev - start)
+                    secondary_seq = secondary_seq[pos_prev - start - num_double_X] + secondary_seq[
+                        (pos - start) : (pos_prev + del_len - start + 1)
+                    ] # TODO pos_prev - 1 - beg might be out of range
+
                     snp[snp_id] = SNV(
                         chrom,
                         haplotype_id,
-                        pos - change_in_reference_space,
-                        v,
-                        seq[idx],
+                        pos_prev - change_in_reference_space,
+                        ref[pos_prev - start - num_double_X] if v =="X" else secondary_seq,
+                        secondary_seq if v =="X" else relevant_seq[pos_prev - start - num_double_X],
                         av,
-                        post * av
+                        post * av,
                     )
-
-        if v == "X":
-            change_in_reference_space += 1
-
-        pos += 1
+        else:
+            tot_snv += 1
+            snp_id = SNP_id(pos=pos, var=seq[idx])
+            if snp_id in snp:
+                snp[snp_id].freq += av
+                snp[snp_id].support += post * av
+            else:
+                snp[snp_id] = SNV(
+                    chrom,
+                    haplotype_id,
+                    pos - change_in_reference_space,
+                    v,
+                    seq[idx],
+                    av,
+                    post * av
+                )
 
     return tot_snv
 
-def parseWindow(line, extended_window_mode, exclude_non_var_pos_threshold,
+def parseWindow(window, extended_window_mode, exclude_non_var_pos_threshold,
                 working_dir, threshold=0.9):
     """SNVs from individual support files, getSNV will build
     the consensus SNVs
@@ -200,7 +213,7 @@ def parseWindow(line, extended_window_mode, exclude_non_var_pos_threshold,
     snp = {}
     reads = 0.0
     # winFile, chrom, beg, end, cov
-    _, chrom, beg, end, _ = line.rstrip().split("\t")
+    _, chrom, beg, end, _ = window
 
     file_stem = "w-%s-%s-%s" % (chrom, beg, end)
     haplo_filename = os.path.join(working_dir, "haplotypes", file_stem + ".reads-support.fas")
@@ -214,18 +227,18 @@ def parseWindow(line, extended_window_mode, exclude_non_var_pos_threshold,
     ref_filename = os.path.join("raw_reads", f"{file_stem}.{ref_name}.fas")
 
     start = int(beg)
+    window_suffix = "-" + beg + "-" + end
     max_snv = -1
 
     try:
-        with open(haplo_filename, "rt") as window, open(ref_filename, "rt") as ref:
-            d = dict([[s.id, str(s.seq).upper()] for s in SeqIO.parse(ref, "fasta")])
+        with open(haplo_filename, "rt") as haplo_file, open(ref_filename, "rt") as ref:
+            d = {record_id: seq.upper() for record_id, _, seq in read_fasta(ref)}
             refSlice = d[chrom]
 
-            for s in SeqIO.parse(window, "fasta"):
-                seq = str(s.seq).upper()
-                haplotype_id = str(s.id.split("|")[0]) + "-" + beg + "-" + end
-                match_obj = search(r"posterior=(.*)\s*ave_reads=(.*)", s.description)
-                post, av = float(match_obj.group(1)), float(match_obj.group(2))
+            for record_id, description, seq in read_fasta(haplo_file):
+                seq = seq.upper()
+                haplotype_name, post, av = _parse_support_header(record_id, description)
+                haplotype_id = haplotype_name + window_suffix
 
                 if post > 1.0:
                     warnings.warn("posterior = %4.3f > 1" % post)
@@ -256,13 +269,12 @@ def parseWindow(line, extended_window_mode, exclude_non_var_pos_threshold,
     return snp
 
 
-def add_SNV_to_dict(all_dict, add_key, add_val):
-    if add_key in all_dict.keys():
-        all_dict[add_key].append(add_val)
-    else:
-        all_dict.update({add_key: [add_val]})
-
-    return all_dict
+def _read_coverage(path="coverage.txt"):
+    """Returns the windows listed in coverage.txt as
+    (winFile, chrom, beg, end, cov) tuples.
+    """
+    with open(path) as cov_file:
+        return [tuple(line.rstrip().split("\t")) for line in cov_file]
 
 
 def getSNV(extended_window_mode, exclude_non_var_pos_threshold, working_dir, window_thresh=0.9):
@@ -281,17 +293,17 @@ def getSNV(extended_window_mode, exclude_non_var_pos_threshold, working_dir, win
     tmp = []
 
     # cycle over all windows reported in coverage.txt
-    with open("coverage.txt") as cov_file, open(
+    with open(
         os.path.join(working_dir, "raw_snv_collected.tsv"), "w"
     ) as f_collect:
         f_collect.write("\t".join(standard_header_row) + "\n")
-        for i in cov_file:
-            snp = parseWindow(i, extended_window_mode, exclude_non_var_pos_threshold,
+        for window in _read_coverage():
+            snp = parseWindow(window, extended_window_mode, exclude_non_var_pos_threshold,
                               working_dir, window_thresh)
-            winFile, chrom, beg, end, cov = i.rstrip().split("\t")
-            # all_snp = join_snp_dict(all_snp, snp)
-            for SNV_id, val in sorted(snp.items()):
-                all_snp = add_SNV_to_dict(all_snp, SNV_id, val)
+            winFile, chrom, beg, end, cov = window
+            snp_sorted = sorted(snp.items())
+            for SNV_id, val in snp_sorted:
+                all_snp.setdefault(SNV_id, []).append(val)
                 f_collect.write(
                     "\t".join(
                         map(
@@ -310,7 +322,7 @@ def getSNV(extended_window_mode, exclude_non_var_pos_threshold, working_dir, win
                 )
 
             # write co-occurring mutation to file
-            for SNV_id, val in sorted(snp.items()):
+            for SNV_id, val in snp_sorted:
                 snv_dict = {
                     "winFile": winFile,
                     "haplotype_id": val.haplotype_id,
@@ -339,9 +351,7 @@ def writeRaw(all_snv, min_windows_coverage, working_dir):
     """
     header_row = ["Chromosome", "Pos", "Ref", "Var"]
 
-    max_number_window_covering_SNV = np.max(
-        [len(val) for _, val in sorted(all_snv.items())]
-    )
+    max_number_window_covering_SNV = max(len(val) for val in all_snv.values())
 
     header_row = header_row + [
         "Frq" + str(k + 1) for k in range(max_number_window_covering_SNV)
@@ -350,30 +360,39 @@ def writeRaw(all_snv, min_windows_coverage, working_dir):
         "Pst" + str(k + 1) for k in range(max_number_window_covering_SNV)
     ]
 
-    with (open(os.path.join(working_dir, "raw_snv.tsv"), "w") as f_raw_snv,
-          open(os.path.join(working_dir, "SNV.tsv"), "w") as f_SNV):
-        f_raw_snv.write("\t".join(header_row) + "\n")
-        f_SNV.write("\t".join(header_row) + "\n")
-
-        for _, val in sorted(all_snv.items()):
+    rows = []
+    for _, val in sorted(all_snv.items()):
 
-            write_line = [val[0].chrom, val[0].pos, val[0].ref, val[0].var]
-            freq_list = [single_val.freq for single_val in val]
-            support_list = [single_val.support for single_val in val]
+        write_line = [val[0].chrom, val[0].pos, val[0].ref, val[0].var]
+        freq_list = [single_val.freq for single_val in val]
+        support_list = [single_val.support for single_val in val]
 
-            number_window_covering_SNV = len(freq_list)
+        number_window_covering_SNV = len(freq_list)
 
-            if number_window_covering_SNV < max_number_window_covering_SNV:
-                filler = (max_number_window_covering_SNV - len(freq_list)) * ["*"]
-                freq_list += filler
-                support_list += filler
+        filler = (max_number_window_covering_SNV - number_window_covering_SNV) * ["*"]
 
-            write_line = write_line + freq_list + support_list
+        rows.append(
+            (
+                number_window_covering_SNV,
+                write_line + freq_list + filler + support_list + filler,
+            )
+        )
 
-            f_raw_snv.write("\t".join(map(str, write_line)) + "\n")
+    with (open(os.path.join(working_dir, "raw_snv.tsv"), "w") as f_raw_snv,
+          open(os.path.join(working_dir, "SNV.tsv"), "w") as f_SNV):
+        raw_writer = csv.writer(f_raw_snv, delimiter="\t", lineterminator="\n")
+        raw_writer.writerow(header_row)
+        raw_writer.writerows([write_line for _, write_line in rows])
 
-            if number_window_covering_SNV >= min_windows_coverage:
-                f_SNV.write("\t".join(map(str, write_line)) + "\n")
+        snv_writer = csv.writer(f_SNV, delimiter="\t", lineterminator="\n")
+        snv_writer.writerow(header_row)
+        snv_writer.writerows(
+            [
+                write_line
+                for number_window_covering_SNV, write_line in rows
+                if number_window_covering_SNV >= min_windows_coverage
+            ]
+        )
 
 
 def sb_filter(
@@ -381,11 +400,11 @@ def sb_filter(
     file_to_append,
     out_file_prefix,
     sigma,
-    amplimode="",
-    drop_indels="",
+    amplimode=False,
+    drop_indels=False,
     max_coverage=100000,
 ):  # TODO max_coverage is 10 times higher than in Cpp
-    """run strand bias filter calling the external program 'fil'"""
+    """run strand bias filter calling fil from libshorah"""
 
     logging.debug("Running fil")
     logging.debug(f"{in_bam} {file_to_append} {out_file_prefix} {sigma} {max_coverage}")
@@ -395,8 +414,8 @@ def sb_filter(
         out_file_prefix,
         sigma,
         max_coverage,
-        False if amplimode == "" else True,
-        False if drop_indels == "" else True,
+        amplimode,
+        drop_indels,
     )
     return retcode
 
@@ -405,23 +424,23 @@ def sb_filter(
 def BH(p_vals, n):
     """performs Benjamini Hochberg procedure, returning q-vals'
     you can also see http://bit.ly/QkTflz
+
+    p_vals is an array of p-values sorted in ascending order, the q-values
+    are returned in the same order.
     """
-    # p_vals contains the p-value and the index where it has been
-    # found, necessary to assign the correct q-value
-    q_vals_l = []
-    prev_bh = 0
-    for i, p in enumerate(p_vals):
-        # Sometimes this correction can give values greater than 1,
-        # so we set those values at 1
-        bh = p[0] * n / (i + 1)
-        bh = min(bh, 1)
-        # To preserve monotonicity in the values, we take the
-        # maximum of the previous value or this one, so that we
-        # don't yield a value less than the previous.
-        bh = max(bh, prev_bh)
-        prev_bh = bh
-        q_vals_l.append((bh, p[1]))
-    return q_vals_l
+    bh = p_vals * n / np.arange(1, len(p_vals) + 1)
+    # Sometimes this correction can give values greater than 1,
+    # so we set those values at 1.
+    # To preserve monotonicity in the values, we take the running
+    # maximum, so that we don't yield a value less than the previous.
+    q_vals = np.maximum.accumulate(np.minimum(bh, 1))
+    # q-values that were clipped are reported as 1, a correction that is
+    # exactly 1 as 1.0; the last correction reaching 1 decides which one
+    last_reaching_1 = np.maximum.accumulate(
+        np.where(bh >= 1, np.arange(len(bh)), 0)
+    )
+    clipped = (q_vals == 1) & (bh[last_reaching_1] > 1)
+    return [1 if c else q for q, c in zip(q_vals.tolist(), clipped.tolist())]
 
 
 def main(args):
@@ -459,9 +478,7 @@ def main(args):
         windows_header_row = f_raw_snv.readline().split("\t")
         windows_header_row[-1] = windows_header_row[-1].split("\n")[0]
 
-    d = " -d" if ignore_indels else ""
-
-    a = " -a" if increment == 1 else ""  # TODO when is increment == 1 (amplimode)
+    amplimode = increment == 1  # TODO when is increment == 1 (amplimode)
 
     # run strand bias filter
     retcode_n = sb_filter(
@@ -469,8 +486,8 @@ def main(args):
         os.path.join(working_dir, "SNV.tsv"),
         os.path.join(working_dir, "SNVs_"),
         sigma,
-        amplimode=a,
-        drop_indels=d,
+        amplimode=amplimode,
+        drop_indels=ignore_indels,
         max_coverage=max_coverage,
     )
 
@@ -478,7 +495,20 @@ def main(args):
         logging.error('sb_filter exited with error %d', retcode_n)
         sys.exit()
 
-    snpFile = glob.glob(os.path.join(working_dir, "SNVs_*.tsv"))[0] # takes the first file only
+    # output of fil: SNVs_{sigma}.tsv, takes the first file only
+    fil_dir = working_dir or "."
+    with os.scandir(fil_dir) as entries:
+        snpFile = next(
+            (
+                os.path.join(working_dir, entry.name)
+                for entry in entries
+                if entry.name.startswith("SNVs_") and entry.name.endswith(".tsv")
+            ),
+            None,
+        )
+    if snpFile is None:
+        logging.error('sb_filter output SNVs_*.tsv not found in %s', fil_dir)
+        sys.exit('sb_filter output SNVs_*.tsv not found in ' + fil_dir)
     logging.debug(f"For BH - selected file: {snpFile}")
 
     write_list = []
@@ -494,14 +524,15 @@ def main(args):
             else:
                 d[idx] = (float(parts[-1]), [line_no])
 
-    p_vals = list(d.values())
+    p_vals = np.array([p for p, _ in d.values()], dtype=float)
+    line_numbers = [indices for _, indices in d.values()]
 
     # sort p values, correct with Benjamini Hochberg and append to output
-    p_vals.sort()
-    q_vals = BH(p_vals, len(p_vals))
+    order = np.argsort(p_vals, kind="stable")
+    q_vals = BH(p_vals[order], len(p_vals))
 
-    for q, indices in q_vals:
-        for i in indices:
+    for q, snv in zip(q_vals, order.tolist()):
+        for i in line_numbers[snv]:
             write_list[i].append(q)
 
     # Write ShoRAH csv output file
@@ -519,11 +550,9 @@ def main(args):
             writer = csv.writer(cf)
             writer.writerow(header_row)
             # only print when q >= 5%
-            for wl in write_list:
-                if (wl[-1] >= 0.05) & (strand_bias_filter==True):
-                    writer.writerow(wl)
-                elif (strand_bias_filter==False):
-                    writer.writerow(wl)
+            writer.writerows(
+                [wl for wl in write_list if (not strand_bias_filter) or wl[-1] >= 0.05]
+            )
 
     max_number_window = int(windows_header_row[-1].split("Pst")[1])
 
@@ -535,7 +564,10 @@ def main(args):
             f"##source=VILOCA",
             f"##reference={args.f}",
         ]
-        ref_m = dict([[s.id, str(s.seq).upper()] for s in SeqIO.parse(reference, "fasta")])
+        with open(reference) as ref_handle:
+            ref_m = {
+                record_id: seq.upper() for record_id, _, seq in read_fasta(ref_handle)
+            }
         for ref_name, ref_seq in ref_m.items(): # TODO can be removed? why?
             VCF_meta.append(
                 f"##contig=<ID={ref_name},length={len(ref_seq)}>",
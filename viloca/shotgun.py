@@ -258,11 +258,11 @@ def get_prop(filename):
     if os.path.exists(filename):
         h = open(filename)
     elif os.path.exists(filename + '.gz'):
-        h = gzip.open(filename + '.gz', 'rb')
+        h = gzip.open(filename + '.gz', 'rt')
     elif os.path.exists('debug/' + filename):
         h = open('debug/' + filename)
     elif os.path.exists('debug/' + filename + '.gz'):
-        h = gzip.open('debug/' + filename + '.gz', 'rb')
+        h = gzip.open('debug/' + filename + '.gz', 'rt')
     else:
         return 'not found'
 